@@ -1,10 +1,16 @@
+import io
 import os
-import subprocess
-from flask import Flask, render_template, request
+from itertools import chain
+from flask import Flask, render_template, request, stream_template
+from werkzeug.utils import secure_filename
+
+from gpx_to_swiss_kroki import kroki_lines
 
 app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+SAVE_UPLOADS = os.environ.get('SAVE_UPLOADS') == '1'  # Uploads zusätzlich auf Disk ablegen
+if SAVE_UPLOADS:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 @app.route('/')
 def index():
@@ -19,23 +25,22 @@ def upload_file():
     if file.filename == '':
         return "Kein Dateiname"
 
-    # Datei speichern
-    filepath = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(filepath)
+    # Datei einlesen (und nur bei Bedarf speichern)
+    data = file.read()
+    if SAVE_UPLOADS:
+        filename = secure_filename(file.filename) or 'upload.gpx'  # Kein Pfad aus dem Dateinamen
+        with open(os.path.join(UPLOAD_FOLDER, filename), 'wb') as f:
+            f.write(data)
 
-    # Skript ausführen und stdout abfangen
+    # Kroki direkt im Prozess aus dem Speicher erzeugen (kein Subprozess, kein erneutes Einlesen)
     try:
-        result = subprocess.run(
-            ['python', 'gpx_to_swiss_kroki.py', filepath], 
-            capture_output=True, 
-            text=True, 
-            check=True
-        )
-        output = result.stdout # Hier ist die Konsolenausgabe
-    except subprocess.CalledProcessError as e:
-        output = f"Fehler im Skript: {e.stderr}"
-
-    return render_template('index.html', output=output)
+        lines = kroki_lines(io.BytesIO(data))
+        output = chain([next(lines)], lines)  # Fehler vor dem Start der Antwort abfangen
+    except Exception as e:
+        output = [f"Fehler im Skript: {e}"]
+
+    # Zeilen an den Browser streamen, sobald sie formatiert sind
+    return stream_template('index.html', output=output)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=4444, debug=True)
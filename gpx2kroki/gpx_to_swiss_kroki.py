@@ -13,16 +13,51 @@ For each point, it calculates:
 
 If elevation data is missing from the GPX file, it can automatically fetch it from
 the swisstopo Height API.
+
+If httpx is installed, per-point elevation requests share one (HTTP/2 if h2 is
+installed) connection.
 """
 
 import xml.etree.ElementTree as ET
+import contextlib
+import importlib.util
 import math
+import os
+import shelve
 import sys
+import threading
 import urllib.request
 import urllib.parse
 import json
-import time
-from typing import List, Tuple, Optional
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import BinaryIO, Iterator, List, Tuple, Optional, TextIO, Union
+
+import numpy as np
+
+# Persistent elevation cache, keyed by 2 m LV95 cells (the resolution of swisstopo's DEM)
+ELEVATION_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'gpx2kroki', 'dem.db')
+ELEVATION_CACHE_CELL = 2.0
+
+# shelve does not support concurrent access; held for every open/read/write/close
+ELEVATION_CACHE_LOCK = threading.Lock()
+
+# Consecutive GPX points closer than this (degrees, ~0.1 m) are treated as duplicates
+DUPLICATE_POINT_TOLERANCE = 1e-6
+
+# A profile sample closer than this (meters) to an input point is that point's sample
+PROFILE_MATCH_TOLERANCE = 0.5
+
+# Samples checked per point, starting at the sample at the point's distance along the line
+PROFILE_MATCH_WINDOW = 8
+
+# Points per profile request, so a long track is never sent as one unbounded request
+PROFILE_CHUNK_SIZE = 500
+
+# Kroki table row: Punkt, E, N, Dist, Hoehe, Delta H, Azimuth (format method bound once)
+ROW_FMT = "{:<6} {:<12.2f} {:<12.2f} {:<12.2f} {:<12} {:<12.2f} {:<12.2f}".format
 
 
 def fetch_elevation_swisstopo(e: float, n: float) -> Optional[float]:
@@ -50,41 +85,279 @@ def fetch_elevation_swisstopo(e: float, n: float) -> Optional[float]:
     return None
 
 
-def wgs84_to_lv95(lat: float, lon: float) -> Tuple[float, float]:
+async def _fill_elevations(lv95_points: List[Tuple[float, float]], max_in_flight: int) -> List[Optional[float]]:
     """
-    Convert WGS84 coordinates (lat/lon) to Swiss LV95 coordinates (E/N).
+    Fetch elevations point by point from swisstopo Height API over one shared httpx client.
     
-    Uses the approximate formulas from swisstopo for coordinate transformation.
-    Reference: https://www.swisstopo.admin.ch/en/knowledge-facts/surveying-geodesy/reference-systems/map-projections.html
+    Args:
+        lv95_points: List of (E, N) tuples in Swiss LV95 coordinates
+        max_in_flight: Maximum number of requests in flight at the same time
+    
+    Returns:
+        List of elevations in meters (same order as input), None where unavailable
+    """
+    import asyncio
+    import httpx
+    
+    semaphore = asyncio.Semaphore(max_in_flight)
+    http2 = importlib.util.find_spec('h2') is not None
+    
+    async with httpx.AsyncClient(http2=http2, timeout=10) as client:
+        async def fetch(e: float, n: float) -> Optional[float]:
+            async with semaphore:
+                try:
+                    response = await client.get(
+                        "https://api3.geo.admin.ch/rest/services/height",
+                        params={'easting': e, 'northing': n, 'sr': 2056},
+                    )
+                    response.raise_for_status()
+                    data = response.json()
+                    if 'height' in data:
+                        return float(data['height'])
+                except Exception as ex:
+                    print(f"Warning: Could not fetch elevation for E={e:.2f}, N={n:.2f}: {ex}", file=sys.stderr)
+            
+            return None
+        
+        return await asyncio.gather(*(fetch(e, n) for e, n in lv95_points))
+
+
+def fetch_elevations_concurrent(lv95_points: List[Tuple[float, float]], max_workers: int = 16) -> List[Optional[float]]:
+    """
+    Fetch elevations point by point from swisstopo Height API with parallel requests.
+    
+    Fallback for when the Profile API cannot be used. Uses asyncio with httpx when
+    available, otherwise a thread pool around fetch_elevation_swisstopo.
     
     Args:
-        lat: Latitude in decimal degrees
-        lon: Longitude in decimal degrees
+        lv95_points: List of (E, N) tuples in Swiss LV95 coordinates
+        max_workers: Maximum number of requests in flight at the same time
     
     Returns:
-        Tuple of (E, N) in Swiss LV95 coordinates (meters)
+        List of elevations in meters (same order as input), None where unavailable
+    """
+    # Imported here: this fallback only runs when the profile request has failed
+    try:  # Optional: async HTTP client sharing one connection for per-point height requests
+        import httpx
+    except ImportError:
+        httpx = None
+    
+    if httpx is not None:
+        import asyncio
+        return asyncio.run(_fill_elevations(lv95_points, max_workers))
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda p: fetch_elevation_swisstopo(*p), lv95_points))
+
+
+def _fetch_elevation_profile(lv95_points: List[Tuple[float, float]]) -> List[Optional[float]]:
+    """
+    Fetch elevations for a chunk of LV95 points with one swisstopo Profile API call.
+    
+    The points are sent as one LineString to the profile endpoint. With
+    ``distinct_points`` the input vertices are part of the returned samples, so each
+    input point is matched to its own sample by coordinates. If the profile request
+    fails, the points are fetched individually with fetch_elevations_concurrent.
+    
+    Args:
+        lv95_points: List of (E, N) tuples in Swiss LV95 coordinates
+    
+    Returns:
+        List of elevations in meters (same order as input), None where unavailable
+    """
+    if len(lv95_points) == 1:
+        # A LineString needs at least two positions; use the height endpoint instead
+        return [fetch_elevation_swisstopo(*lv95_points[0])]
+    
+    try:
+        # swisstopo Profile API endpoint (geometry is sent in the request body)
+        geom = {"type": "LineString", "coordinates": [[e, n] for e, n in lv95_points]}
+        params = urllib.parse.urlencode({'sr': 2056, 'nb_points': len(lv95_points), 'distinct_points': 'true'})
+        url = f"https://api3.geo.admin.ch/rest/services/profile.json?{params}"
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(geom).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        
+        with urllib.request.urlopen(request, timeout=30) as response:
+            samples = json.loads(response.read().decode())
+    except Exception as ex:
+        print(f"Warning: Could not fetch elevation profile for {len(lv95_points)} points, falling back to single requests: {ex}", file=sys.stderr)
+        return fetch_elevations_concurrent(lv95_points)
+    
+    sample_dists = [float(s['dist']) for s in samples]
+    sample_coords = [(float(s['easting']), float(s['northing'])) for s in samples]
+    sample_alts = [s.get('alts', {}).get('COMB') for s in samples]
+    
+    # Samples follow the line, so each point is only compared with the few samples
+    # from its own distance along the line on (never before the previous match)
+    elevations = []
+    unmatched = 0
+    j = 0
+    point_dist = 0.0
+    prev_e, prev_n = lv95_points[0]
+    for e, n in lv95_points:
+        point_dist += calculate_distance(prev_e, prev_n, e, n)
+        prev_e, prev_n = e, n
+        
+        start = bisect_left(sample_dists, point_dist - PROFILE_MATCH_TOLERANCE, j)
+        for k in range(start, min(start + PROFILE_MATCH_WINDOW, len(samples))):
+            if calculate_distance(e, n, *sample_coords[k]) <= PROFILE_MATCH_TOLERANCE:
+                j = k
+                alt = sample_alts[k]
+                elevations.append(float(alt) if alt is not None else None)
+                break
+        else:
+            unmatched += 1
+            elevations.append(None)
+    
+    if unmatched:
+        print(f"Warning: No elevation profile sample for {unmatched} points", file=sys.stderr)
+    
+    return elevations
+
+
+def fetch_elevations_bulk(lv95_points: List[Tuple[float, float]]) -> List[Optional[float]]:
+    """
+    Fetch elevations for many LV95 points with swisstopo Profile API calls.
+    
+    The points are sent in chunks of PROFILE_CHUNK_SIZE, one profile request per
+    chunk, so a failing request only falls back to single requests for its chunk.
+    
+    Args:
+        lv95_points: List of (E, N) tuples in Swiss LV95 coordinates
+    
+    Returns:
+        List of elevations in meters (same order as input), None where unavailable
+    """
+    elevations = []
+    for start in range(0, len(lv95_points), PROFILE_CHUNK_SIZE):
+        elevations.extend(_fetch_elevation_profile(lv95_points[start:start + PROFILE_CHUNK_SIZE]))
+    
+    return elevations
+
+
+def open_elevation_cache():
+    """
+    Open the on-disk elevation cache.
+    
+    Callers must hold ELEVATION_CACHE_LOCK until the cache is closed again.
+    
+    Returns:
+        Context manager yielding a shelve (or an empty dict if the cache cannot be opened)
+    """
+    try:
+        os.makedirs(os.path.dirname(ELEVATION_CACHE_FILE), exist_ok=True)
+        return shelve.open(ELEVATION_CACHE_FILE)
+    except Exception as ex:
+        print(f"Warning: Elevation cache unavailable: {ex}", file=sys.stderr)
+        return contextlib.nullcontext({})
+
+
+def fetch_elevations_cached(lv95_points: List[Tuple[float, float]]) -> List[Optional[float]]:
+    """
+    Fetch elevations for LV95 points, using the on-disk cache where possible.
+    
+    Points are grouped by 2 m cell, so a cell visited several times (e.g. on an
+    out-and-back route) is requested at most once. fetch_elevations_bulk is only
+    called for cells not found in the cache.
+    
+    Args:
+        lv95_points: List of (E, N) tuples in Swiss LV95 coordinates
+    
+    Returns:
+        List of elevations in meters (same order as input), None where unavailable
+    """
+    keys = [f"{int(e / ELEVATION_CACHE_CELL)},{int(n / ELEVATION_CACHE_CELL)}" for e, n in lv95_points]
+    
+    with ELEVATION_CACHE_LOCK, open_elevation_cache() as cache:
+        known = {key: cache[key] for key in set(keys) if key in cache}
+    
+    # One request point per uncached cell
+    pending = {}
+    for key, point in zip(keys, lv95_points):
+        if key not in known and key not in pending:
+            pending[key] = point
+    
+    if pending:
+        # The cache is not locked while waiting for the API
+        fetched = fetch_elevations_bulk(list(pending.values()))
+        new = {key: ele for key, ele in zip(pending, fetched) if ele is not None}
+        known.update(new)
+        
+        if new:
+            with ELEVATION_CACHE_LOCK, open_elevation_cache() as cache:
+                cache.update(new)
+    
+    return [known.get(key) for key in keys]
+
+
+def _lv95_polynomial(lat, lon):
+    """
+    Evaluate the swisstopo WGS84 -> LV95 polynomial.
+    
+    Works on plain floats as well as NumPy arrays.
     """
     # Convert to auxiliary values (unit: 10000")
     lat_aux = (lat * 3600 - 169028.66) / 10000
     lon_aux = (lon * 3600 - 26782.5) / 10000
+    lat_aux2 = lat_aux * lat_aux
+    lon_aux2 = lon_aux * lon_aux
     
     # Calculate Swiss coordinates (LV95)
     E = (2600072.37 + 
          211455.93 * lon_aux - 
          10938.51 * lon_aux * lat_aux - 
-         0.36 * lon_aux * lat_aux**2 - 
-         44.54 * lon_aux**3)
+         0.36 * lon_aux * lat_aux2 - 
+         44.54 * lon_aux2 * lon_aux)
     
     N = (1200147.07 + 
          308807.95 * lat_aux + 
-         3745.25 * lon_aux**2 + 
-         76.63 * lat_aux**2 - 
-         194.56 * lon_aux**2 * lat_aux + 
-         119.79 * lat_aux**3)
+         3745.25 * lon_aux2 + 
+         76.63 * lat_aux2 - 
+         194.56 * lon_aux2 * lat_aux + 
+         119.79 * lat_aux2 * lat_aux)
     
     return E, N
 
 
+def wgs84_to_lv95_vec(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert arrays of WGS84 coordinates (lat/lon) to Swiss LV95 coordinates (E/N).
+    
+    Uses the approximate formulas from swisstopo for coordinate transformation,
+    evaluated for the whole track at once.
+    Reference: https://www.swisstopo.admin.ch/en/knowledge-facts/surveying-geodesy/reference-systems/map-projections.html
+    
+    Args:
+        lat: Array of latitudes in decimal degrees
+        lon: Array of longitudes in decimal degrees
+    
+    Returns:
+        Tuple of arrays (E, N) in Swiss LV95 coordinates (meters)
+    """
+    return _lv95_polynomial(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+
+
+def wgs84_to_lv95(lat: float, lon: float) -> Tuple[float, float]:
+    """
+    Convert a single WGS84 coordinate (lat/lon) to Swiss LV95 coordinates (E/N).
+    
+    Scalar counterpart of wgs84_to_lv95_vec, kept for single-point callers.
+    
+    Args:
+        lat: Latitude in decimal degrees
+        lon: Longitude in decimal degrees
+    
+    Returns:
+        Tuple of (E, N) in Swiss LV95 coordinates (meters)
+    """
+    E, N = _lv95_polynomial(float(lat), float(lon))
+    return float(E), float(N)
+
+
 def calculate_distance(e1: float, n1: float, e2: float, n2: float) -> float:
     """
     Calculate horizontal distance between two points in meters.
@@ -96,7 +369,7 @@ def calculate_distance(e1: float, n1: float, e2: float, n2: float) -> float:
     Returns:
         Distance in meters
     """
-    return math.sqrt((e2 - e1)**2 + (n2 - n1)**2)
+    return math.hypot(e2 - e1, n2 - n1)
 
 
 def calculate_azimuth(e1: float, n1: float, e2: float, n2: float) -> float:
@@ -115,178 +388,196 @@ def calculate_azimuth(e1: float, n1: float, e2: float, n2: float) -> float:
     delta_e = e2 - e1
     delta_n = n2 - n1
     
-    # Calculate angle in radians, then convert to degrees
-    azimuth_rad = math.atan2(delta_e, delta_n)
-    azimuth_deg = math.degrees(azimuth_rad)
-    
-    # Normalize to 0-360 range
-    if azimuth_deg < 0:
-        azimuth_deg += 360
-    
-    return azimuth_deg
+    # atan2 lies in [-180°, 180°], so shifting by 360° before fmod always gives 0-360
+    return math.fmod(math.degrees(math.atan2(delta_e, delta_n)) + 360.0, 360.0)
 
 
-def parse_gpx(gpx_file: str) -> List[Tuple[float, float, Optional[float]]]:
+def parse_gpx(gpx_file: Union[str, BinaryIO]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Parse GPX file and extract track/route points with coordinates and elevation.
     
+    The file is streamed in a single pass. Track points are preferred over route
+    points, which are preferred over waypoints. Runs of consecutive identical
+    points (e.g. at rest stops) are collapsed into their first point.
+    
     Args:
-        gpx_file: Path to GPX file
+        gpx_file: Path to GPX file, or a binary file-like object with its content
     
     Returns:
-        List of tuples (latitude, longitude, elevation)
+        Tuple of float64 arrays (latitude, longitude, elevation); missing elevations are NaN
     """
-    tree = ET.parse(gpx_file)
-    root = tree.getroot()
-    
     # Handle XML namespace
-    ns = {'gpx': 'http://www.topografix.com/GPX/1/1'}
+    ns = '{http://www.topografix.com/GPX/1/1}'
+    ele_tag = ns + 'ele'
+    
+    # Point kinds by priority: track points, route points, waypoints
+    priority = {ns + 'trkpt': 0, ns + 'rtept': 1, ns + 'wpt': 2}
+    best = len(priority)
+    
+    # Coordinates are collected in contiguous double buffers, not per-point tuples
+    lats, lons, eles = array('d'), array('d'), array('d')
+    dropped = 0
     
-    points = []
+    # Open elements, so a finished point can be detached from its trkseg/rte/gpx parent
+    stack = []
     
-    # Try to find track points (trkpt)
-    for trkpt in root.findall('.//gpx:trkpt', ns):
-        lat_str = trkpt.get('lat')
-        lon_str = trkpt.get('lon')
-        if lat_str is None or lon_str is None:
+    for event, elem in ET.iterparse(gpx_file, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        
+        rank = priority.get(elem.tag)
+        if rank is None:
             continue
-        lat = float(lat_str)
-        lon = float(lon_str)
-        ele_elem = trkpt.find('gpx:ele', ns)
-        ele = float(ele_elem.text) if ele_elem is not None and ele_elem.text else None
-        points.append((lat, lon, ele))
-    
-    # If no track points, try route points (rtept)
-    if not points:
-        for rtept in root.findall('.//gpx:rtept', ns):
-            lat_str = rtept.get('lat')
-            lon_str = rtept.get('lon')
-            if lat_str is None or lon_str is None:
-                continue
-            lat = float(lat_str)
-            lon = float(lon_str)
-            ele_elem = rtept.find('gpx:ele', ns)
-            ele = float(ele_elem.text) if ele_elem is not None and ele_elem.text else None
-            points.append((lat, lon, ele))
-    
-    # If still no points, try waypoints (wpt)
-    if not points:
-        for wpt in root.findall('.//gpx:wpt', ns):
-            lat_str = wpt.get('lat')
-            lon_str = wpt.get('lon')
-            if lat_str is None or lon_str is None:
-                continue
-            lat = float(lat_str)
-            lon = float(lon_str)
-            ele_elem = wpt.find('gpx:ele', ns)
-            ele = float(ele_elem.text) if ele_elem is not None and ele_elem.text else None
-            points.append((lat, lon, ele))
-    
-    return points
-
-
-def generate_kroki(gpx_file: str, output_file: Optional[str] = None, fetch_elevation: bool = True):
+        
+        if rank <= best:
+            # A higher-priority point kind replaces everything collected so far
+            if rank < best:
+                best = rank
+                lats, lons, eles = array('d'), array('d'), array('d')
+                dropped = 0
+            
+            lat_str = elem.get('lat')
+            lon_str = elem.get('lon')
+            if lat_str is not None and lon_str is not None:
+                lat = float(lat_str)
+                lon = float(lon_str)
+                if (lats
+                        and abs(lat - lats[-1]) < DUPLICATE_POINT_TOLERANCE
+                        and abs(lon - lons[-1]) < DUPLICATE_POINT_TOLERANCE):
+                    dropped += 1
+                else:
+                    ele_elem = elem.find(ele_tag)
+                    lats.append(lat)
+                    lons.append(lon)
+                    eles.append(float(ele_elem.text) if ele_elem is not None and ele_elem.text else math.nan)
+        
+        # Free every point (kept or skipped): drop its children and detach it from the
+        # parent, where it is the last child, so the tree does not grow with the track
+        elem.clear()
+        if stack:
+            del stack[-1][-1]
+    
+    if dropped:
+        print(f"Dropped {dropped} duplicate consecutive points", file=sys.stderr)
+    
+    # Zero-copy views on the buffers
+    return (np.frombuffer(lats, dtype=np.float64),
+            np.frombuffer(lons, dtype=np.float64),
+            np.frombuffer(eles, dtype=np.float64))
+
+
+def kroki_lines(gpx_file: Union[str, BinaryIO], fetch_elevation: bool = True) -> Iterator[str]:
     """
-    Generate Kroki (route profile) from GPX file with Swiss coordinates.
+    Generate Kroki (route profile) lines from GPX file with Swiss coordinates.
+    
+    All computation happens before the first line is yielded; the lines themselves
+    are formatted one at a time, so the report is never held in memory as a whole.
     
     Args:
-        gpx_file: Path to input GPX file
-        output_file: Optional path to output file (if None, prints to stdout)
+        gpx_file: Path to input GPX file, or a binary file-like object with its content
         fetch_elevation: If True, fetch missing elevation data from swisstopo API
+    
+    Yields:
+        Report lines without trailing line breaks
+    
+    Raises:
+        ValueError: If the GPX file contains no points
     """
     # Parse GPX file
-    points = parse_gpx(gpx_file)
+    lat, lon, ele = parse_gpx(gpx_file)
     
-    if not points:
-        print("Error: No points found in GPX file", file=sys.stderr)
-        return
+    if not len(lat):
+        raise ValueError("No points found in GPX file")
     
-    # Convert to Swiss coordinates and fetch elevation if needed
-    swiss_points = []
-    missing_elevation = any(ele is None for _, _, ele in points)
+    # Convert to Swiss coordinates (whole track at once)
+    E, N = wgs84_to_lv95_vec(lat, lon)
     
-    if missing_elevation and fetch_elevation:
-        print("Fetching elevation data from swisstopo API...", file=sys.stderr)
+    # Fetch missing elevations (cache first, then one bulk request) if requested
+    missing = np.flatnonzero(np.isnan(ele))
     
-    for i, (lat, lon, ele) in enumerate(points):
-        e, n = wgs84_to_lv95(lat, lon)
+    if len(missing) and fetch_elevation:
+        print("Fetching elevation data from swisstopo API...", file=sys.stderr)
         
-        # Fetch elevation if missing and requested
-        if ele is None and fetch_elevation:
-            ele = fetch_elevation_swisstopo(e, n)
-            if ele is not None:
-                print(f"  Point {i+1}: Elevation fetched: {ele:.2f} m", file=sys.stderr)
-            # Add small delay to respect API rate limits
-            time.sleep(0.1)
+        fetched = fetch_elevations_cached(list(zip(E[missing].tolist(), N[missing].tolist())))
+        for i, h in zip(missing.tolist(), fetched):
+            if h is not None:
+                ele[i] = h
+                print(f"  Point {i+1}: Elevation fetched: {h:.2f} m", file=sys.stderr)
         
-        swiss_points.append((e, n, ele))
-    
-    if missing_elevation and fetch_elevation:
         print("", file=sys.stderr)
     
-    # Prepare output
-    output_lines = []
-    output_lines.append("=" * 100)
-    output_lines.append("KROKI - Route Profile with Swiss LV95 Coordinates")
-    output_lines.append("=" * 100)
-    output_lines.append("")
-    output_lines.append(f"{'Punkt':<6} {'E (m)':<12} {'N (m)':<12} {'Dist (m)':<12} {'Hoehe (m)':<12} {'Delta H (m)':<12} {'Azimuth (°)':<12}")
-    output_lines.append("-" * 100)
-    
-    # Process each point
-    for i, (e, n, ele) in enumerate(swiss_points, start=1):
-        if i == 1:
-            # First point - no previous point for comparison
-            dist = 0.0
-            delta_ele = 0.0
-            azimuth = 0.0
-            ele_str = f"{ele:.2f}" if ele is not None else "N/A"
-            output_lines.append(f"{i:<6} {e:<12.2f} {n:<12.2f} {dist:<12.2f} {ele_str:<12} {delta_ele:<12.2f} {azimuth:<12.2f}")
-        else:
-            # Calculate values relative to previous point
-            prev_e, prev_n, prev_ele = swiss_points[i-2]
-            
-            dist = calculate_distance(prev_e, prev_n, e, n)
-            azimuth = calculate_azimuth(prev_e, prev_n, e, n)
-            
-            if ele is not None and prev_ele is not None:
-                delta_ele = ele - prev_ele
-                ele_str = f"{ele:.2f}"
-            else:
-                delta_ele = 0.0
-                ele_str = "N/A"
-            
-            output_lines.append(f"{i:<6} {e:<12.2f} {n:<12.2f} {dist:<12.2f} {ele_str:<12} {delta_ele:<12.2f} {azimuth:<12.2f}")
+    # Distance, azimuth and elevation change per point (whole track at once, 0 for the first point)
+    dE = np.diff(E, prepend=E[:1])
+    dN = np.diff(N, prepend=N[:1])
+    dist = np.hypot(dE, dN)
+    azimuth = np.degrees(np.arctan2(dE, dN)) % 360.0  # Normalize to 0-360 without a mask
+    delta_ele = np.nan_to_num(np.diff(ele, prepend=ele[:1]), nan=0.0)  # 0 where either side is missing
+    
+    # Output header
+    yield "=" * 100
+    yield "KROKI - Route Profile with Swiss LV95 Coordinates"
+    yield "=" * 100
+    yield ""
+    yield f"{'Punkt':<6} {'E (m)':<12} {'N (m)':<12} {'Dist (m)':<12} {'Hoehe (m)':<12} {'Delta H (m)':<12} {'Azimuth (°)':<12}"
+    yield "-" * 100
+    
+    # Process each point (columns as Python floats, so rows are formatted without NumPy scalars)
+    columns = zip(E.tolist(), N.tolist(), dist.tolist(), ele.tolist(), delta_ele.tolist(), azimuth.tolist())
+    has_all_ele = True
+    prev_has_ele = True
+    for i, (e, n, d, h, dh, az) in enumerate(columns, start=1):
+        has_ele = not math.isnan(h)
+        has_all_ele &= has_ele
+        
+        # Elevation is only shown where its delta to the previous point could be computed
+        ele_str = f"{h:.2f}" if has_ele and prev_has_ele else "N/A"
+        prev_has_ele = has_ele
+        
+        yield ROW_FMT(i, e, n, d, ele_str, dh, az)
     
-    output_lines.append("-" * 100)
+    yield "-" * 100
     
     # Calculate totals
-    total_dist = sum(calculate_distance(swiss_points[i-1][0], swiss_points[i-1][1], 
-                                       swiss_points[i][0], swiss_points[i][1]) 
-                    for i in range(1, len(swiss_points)))
-    
-    if all(p[2] is not None for p in swiss_points):
-        total_ascent = sum(max(0, swiss_points[i][2] - swiss_points[i-1][2]) 
-                          for i in range(1, len(swiss_points)))
-        total_descent = sum(max(0, swiss_points[i-1][2] - swiss_points[i][2]) 
-                           for i in range(1, len(swiss_points)))
-        output_lines.append(f"\nTotal Distance: {total_dist:.2f} m")
-        output_lines.append(f"Total Ascent: {total_ascent:.2f} m")
-        output_lines.append(f"Total Descent: {total_descent:.2f} m")
-    else:
-        output_lines.append(f"\nTotal Distance: {total_dist:.2f} m")
+    yield f"\nTotal Distance: {dist.sum():.2f} m"
+    if has_all_ele:
+        total_ascent = np.clip(delta_ele, 0.0, None).sum()
+        total_descent = np.clip(-delta_ele, 0.0, None).sum()
+        yield f"Total Ascent: {total_ascent:.2f} m"
+        yield f"Total Descent: {total_descent:.2f} m"
+
+
+def generate_kroki(gpx_file: Union[str, BinaryIO], output_file: Optional[str] = None, fetch_elevation: bool = True,
+                   out: Optional[TextIO] = None):
+    """
+    Generate Kroki (route profile) from GPX file with Swiss coordinates.
+    
+    Lines are written as they are formatted instead of being joined into one string.
     
-    output_lines.append("")
+    Args:
+        gpx_file: Path to input GPX file, or a binary file-like object with its content
+        output_file: Optional path to output file (if None, writes to out)
+        fetch_elevation: If True, fetch missing elevation data from swisstopo API
+        out: Stream to write to when no output file is given (default: stdout)
+    
+    Raises:
+        ValueError: If the GPX file contains no points
+    """
+    lines = kroki_lines(gpx_file, fetch_elevation)
     
-    # Output results
-    output_text = "\n".join(output_lines)
+    # Parse and compute before any output (or output file) is created
+    lines = chain([next(lines)], lines)
     
     if output_file:
         with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(output_text)
+            for line in lines:
+                f.write(line + "\n")
         print(f"Kroki saved to: {output_file}")
     else:
-        print(output_text)
+        out = out if out is not None else sys.stdout
+        for line in lines:
+            out.write(line + "\n")
 
 
 def main():
@@ -6,18 +6,27 @@ Features
 * Parses GPX tracks / routes / way-points.
 * Converts WGS-84 lat/lon to LV95 (E/N) with pyproj.
 * Calculates planar distance & azimuth on LV95 (fast, sufficient for typical routes).
-* Optionally fetches missing elevations from the Swisstopo Height API.
+* Optionally fetches missing elevations from the Swisstopo Height API (cached in ~/.cache/gpx2kroki).
 * Outputs a nicely formatted route profile ("Kroki") either to stdout or a file.
 """
 
 import argparse
+import contextlib
 import logging
+import math
+import numpy as np
 import requests
+import shelve
 import sys
+import threading
 
 import xml.etree.ElementTree as ET
 
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 from pyproj import Transformer, Geod
 from typing import List, Tuple, Optional
 
@@ -39,14 +48,70 @@ SWISSTOPO_HEIGHT_API = (
     "?easting={e}&northing={n}&sr=2056"
 )
 
-LV95_TRANSFORMER = Transformer.from_crs(
-    "EPSG:4326",   # WGS-84
-    "EPSG:2056",   # LV95
-    always_xy=True,
+SWISSTOPO_PROFILE_API = "https://api3.geo.admin.ch/rest/services/profile.json"
+
+PROFILE_MATCH_TOLERANCE = 0.5  # Meters; a profile sample this close to an input point is that point.
+PROFILE_MATCH_WINDOW = 8  # Samples checked per point, from the sample at its distance along the line.
+PROFILE_CHUNK_SIZE = 500  # Points per profile request, so long tracks are never sent in one request.
+
+HEIGHT_API_WORKERS = 16  # Parallel per-point requests when the profile API is unavailable.
+
+# Shared session so connections (TCP + TLS) are kept alive and reused across requests.
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=HEIGHT_API_WORKERS, pool_maxsize=HEIGHT_API_WORKERS),
+)
+
+# Persistent elevation cache, keyed by 2 m LV95 cells (the resolution of the Swisstopo DEM).
+ELEVATION_CACHE_FILE = Path.home() / ".cache" / "gpx2kroki" / "dem.db"
+ELEVATION_CACHE_CELL = 2.0
+ELEVATION_CACHE_LOCK = threading.Lock()  # shelve does not support concurrent access.
+
+DUPLICATE_POINT_TOLERANCE = 1e-6  # Degrees (~0.1 m); closer consecutive points are dropped.
+
+# WGS-84 (lon, lat) → LV95 (E, N) as an explicit PROJ pipeline – the operation PROJ selects
+# for EPSG:4326 → EPSG:2056 with always_xy=True, without the CRS and axis-order lookups.
+LV95_TRANSFORMER = Transformer.from_pipeline(
+    "+proj=pipeline"
+    " +step +proj=unitconvert +xy_in=deg +xy_out=rad"
+    " +step +proj=push +v_3"
+    " +step +proj=cart +ellps=WGS84"
+    " +step +proj=helmert +x=-674.374 +y=-15.056 +z=-405.346"  # WGS-84 → CH1903+ datum shift
+    " +step +inv +proj=cart +ellps=bessel"
+    " +step +proj=pop +v_3"
+    " +step +proj=somerc +lat_0=46.9524055555556 +lon_0=7.43958333333333 +k_0=1"
+    " +x_0=2600000 +y_0=1200000 +ellps=bessel"
 )
 
 GEOD = Geod(ellps="WGS84")  # Distance/azimuth calculations on geodesic.
 
+# --------------------------------------------------------------------------- #
+# Data structures
+# --------------------------------------------------------------------------- #
+@dataclass
+class Profile:
+    """
+    Route profile stored as parallel float64 arrays, one entry per point.
+
+    Attributes:
+        e: LV95 E coordinates.
+        n: LV95 N coordinates.
+        ele: Resolved elevations.
+        dist: Distance from the previous point (0.0 for the first point).
+        azimuth: Azimuth from the previous point (0.0 for the first point).
+        delta_ele: Elevation change from the previous point (0.0 for the first point).
+    """
+    e: np.ndarray
+    n: np.ndarray
+    ele: np.ndarray
+    dist: np.ndarray
+    azimuth: np.ndarray
+    delta_ele: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.e)
+
 # --------------------------------------------------------------------------- #
 # Helper functions
 # --------------------------------------------------------------------------- #
@@ -73,7 +138,7 @@ def fetch_elevation(ele: float | None, e: float, n: float, use_height_api: bool)
         return 0.0
 
     try:
-        resp = requests.get(SWISSTOPO_HEIGHT_API.format(e=e, n=n), timeout=10)
+        resp = SESSION.get(SWISSTOPO_HEIGHT_API.format(e=e, n=n), timeout=10)
         resp.raise_for_status()
         data = resp.json()
         return float(data["height"])
@@ -85,9 +150,168 @@ def fetch_elevation(ele: float | None, e: float, n: float, use_height_api: bool)
         return 0.0
 
 
+def fetch_elevations_concurrent(lv95_points: List[Tuple[float, float]]) -> List[float]:
+    """
+    Fetch elevations point by point from the Swisstopo Height API, several requests in flight.
+
+    Fallback for when the profile endpoint cannot be used. Requests share `SESSION`, so
+    connections are reused instead of being set up again for every point.
+
+    Params:
+        lv95_points: List of (E, N) tuples in LV95.
+    Returns:
+        A list of elevations as floats (0.0 where unavailable), in the same order as the input.
+    """
+    with ThreadPoolExecutor(max_workers=HEIGHT_API_WORKERS) as executor:
+        return list(
+            executor.map(lambda pt: fetch_elevation(None, pt[0], pt[1], use_height_api=True), lv95_points)
+        )
+
+
+def _fetch_elevation_profile(lv95_points: List[Tuple[float, float]]) -> List[float]:
+    """
+    Fetch elevations for a chunk of LV95 points with one Swisstopo Profile API call.
+
+    The points are posted as one LineString. With `distinct_points` the input vertices are
+    part of the returned samples, so every input point is matched to its own sample by
+    coordinates. If the profile request fails, the points are fetched individually with
+    `fetch_elevations_concurrent`.
+
+    Params:
+        lv95_points: List of (E, N) tuples in LV95.
+    Returns:
+        A list of elevations as floats, in the same order as the input.
+    """
+    if len(lv95_points) == 1:  # A LineString needs at least two positions.
+        e, n = lv95_points[0]
+        return [fetch_elevation(None, e, n, use_height_api=True)]
+
+    try:
+        resp = SESSION.post(
+            SWISSTOPO_PROFILE_API,
+            params={"sr": 2056, "nb_points": len(lv95_points), "distinct_points": "true"},
+            json={"type": "LineString", "coordinates": [[e, n] for e, n in lv95_points]},
+            timeout=30,
+        )
+        resp.raise_for_status()
+        samples = resp.json()
+
+    except Exception as exc:
+        logger.warning(
+            f"Could not fetch elevation profile for {len(lv95_points)} points, "
+            f"falling back to per-point requests: {exc}"
+        )
+        return fetch_elevations_concurrent(lv95_points)
+
+    if not samples:
+        return [0.0] * len(lv95_points)
+
+    sample_dists = [float(s["dist"]) for s in samples]
+    sample_coords = [(float(s["easting"]), float(s["northing"])) for s in samples]
+    sample_alts = [s.get("alts", {}).get("COMB") for s in samples]  # None outside DEM coverage
+
+    # Samples follow the line, so each point is only compared with the few samples from its
+    # own distance along the line on (never before the previous match)
+    elevations = []
+    unmatched = 0
+    j = 0
+    point_dist = 0.0
+    prev_e, prev_n = lv95_points[0]
+    for e, n in lv95_points:
+        point_dist += math.hypot(e - prev_e, n - prev_n)
+        prev_e, prev_n = e, n
+
+        start = bisect_left(sample_dists, point_dist - PROFILE_MATCH_TOLERANCE, j)
+        for k in range(start, min(start + PROFILE_MATCH_WINDOW, len(samples))):
+            sample_e, sample_n = sample_coords[k]
+            if math.hypot(e - sample_e, n - sample_n) <= PROFILE_MATCH_TOLERANCE:
+                j = k
+                elevations.append(float(sample_alts[k]) if sample_alts[k] is not None else 0.0)
+                break
+        else:
+            unmatched += 1
+            elevations.append(0.0)
+
+    if unmatched:
+        logger.warning(f"No elevation profile sample for {unmatched} points")
+
+    return elevations
+
+
+def fetch_elevations_bulk(lv95_points: List[Tuple[float, float]]) -> List[float]:
+    """
+    Fetch elevations for many LV95 points with Swisstopo Profile API calls.
+
+    The points are sent in chunks of `PROFILE_CHUNK_SIZE`, one profile request per chunk, so
+    a failing request only falls back to per-point requests for its own chunk.
+
+    Params:
+        lv95_points: List of (E, N) tuples in LV95.
+    Returns:
+        A list of elevations as floats, in the same order as the input.
+    """
+    elevations = []
+    for start in range(0, len(lv95_points), PROFILE_CHUNK_SIZE):
+        elevations.extend(_fetch_elevation_profile(lv95_points[start:start + PROFILE_CHUNK_SIZE]))
+
+    return elevations
+
+
+def open_elevation_cache():
+    """
+    Open the on-disk elevation cache. Callers must hold `ELEVATION_CACHE_LOCK` until it is closed.
+
+    Returns:
+        A context manager yielding a shelve, or an empty dict if the cache cannot be opened.
+    """
+    try:
+        ELEVATION_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        return shelve.open(str(ELEVATION_CACHE_FILE))
+
+    except Exception as exc:
+        logger.warning(f"Elevation cache unavailable: {exc}")
+        return contextlib.nullcontext({})
+
+
+def fetch_elevations_cached(lv95_points: List[Tuple[float, float]]) -> List[float]:
+    """
+    Fetch elevations for LV95 points, serving repeated 2 m cells from the on-disk cache.
+
+    Each uncached cell is requested once via `fetch_elevations_bulk`, even if the route
+    passes through it several times.
+
+    Params:
+        lv95_points: List of (E, N) tuples in LV95.
+    Returns:
+        A list of elevations as floats (0.0 where unavailable), in the same order as the input.
+    """
+    keys = [f"{int(e / ELEVATION_CACHE_CELL)},{int(n / ELEVATION_CACHE_CELL)}" for e, n in lv95_points]
+
+    with ELEVATION_CACHE_LOCK, open_elevation_cache() as cache:
+        known = {key: cache[key] for key in set(keys) if key in cache}
+
+    pending = {}  # One request point per uncached cell
+    for key, point in zip(keys, lv95_points):
+        if key not in known and key not in pending:
+            pending[key] = point
+
+    if pending:
+        fetched = fetch_elevations_bulk(list(pending.values()))  # Cache not locked while waiting
+        known.update(zip(pending, fetched))
+
+        new = {key: ele for key, ele in zip(pending, fetched) if ele != 0.0}  # 0.0 marks a failed lookup
+        if new:
+            with ELEVATION_CACHE_LOCK, open_elevation_cache() as cache:
+                cache.update(new)
+
+    return [known[key] for key in keys]
+
+
 def parse_gpx(gpx_path: Path) -> List[Tuple[float, float, Optional[float]]]:
     """
     Extract (lat, lon, elevation) triples from a GPX file.
+
+    Runs of consecutive identical points (e.g. at rest stops) are collapsed into their first point.
     
     Params:
         gpx_path: Path to the GPX file.
@@ -114,56 +338,68 @@ def parse_gpx(gpx_path: Path) -> List[Tuple[float, float, Optional[float]]]:
             or root.findall(".//gpx:wpt", ns)
         )
     ]
-    return points
+
+    deduped = points[:1]
+    for lat, lon, ele in points[1:]:
+        prev_lat, prev_lon, _ = deduped[-1]
+        if abs(lat - prev_lat) < DUPLICATE_POINT_TOLERANCE and abs(lon - prev_lon) < DUPLICATE_POINT_TOLERANCE:
+            continue
+        deduped.append((lat, lon, ele))
+
+    if len(deduped) < len(points):
+        # stderr, not the logger: its handler writes to stdout, next to the report
+        print(f"Dropped {len(points) - len(deduped)} duplicate consecutive points", file=sys.stderr)
+
+    return deduped
 
 
 def build_profile(
     points: List[Tuple[float, float, Optional[float]]],
     use_height_api: bool = True,
-) -> List[dict]:
+) -> Profile:
     """
-    Create a list of dicts containing LV95 coords, distance, azimuth, and elevation info for each point.
+    Create a Profile containing LV95 coords, distance, azimuth, and elevation info for each point.
     Params:
         points: List of (lat, lon, elevation) tuples.
         use_height_api: Whether to attempt fetching elevation from the API if elevation data is missing.
     Returns:
-        A list of dicts, each with keys: 'e', 'n', 'ele', 'dist', 'azimuth', 'delta_ele'.
+        A Profile with one array entry per point.
     """
-    profile = []
-    dist, azim, d_ele = 0.0, 0.0, 0.0
-
-    for idx, (lat, lon, ele) in enumerate(points):
-        # Map WGS-84 lat/lon to LV95 E/N
-        e, n = LV95_TRANSFORMER.transform(lon, lat)
-
-        # Resolve elevation once – reuse for both current point and delta calc
-        resolved_ele = fetch_elevation(ele, e, n, use_height_api)
-        
-        if idx > 0:
-            prev = points[idx - 1]
-            azim, _, dist = GEOD.inv(prev[1], prev[0], lon, lat) # Azimuth and distance based on WGS-84 lat/lon
-            d_ele = resolved_ele - profile[-1]['ele']  # Elevation change based on resolved elevation
-
-        profile.append(
-            {
-                "e": e,
-                "n": n,
-                "ele": resolved_ele,
-                "dist": dist,
-                "azimuth": azim,
-                "delta_ele": d_ele,
-            }
-        )
+    # Map WGS-84 lat/lon to LV95 E/N – one PROJ call for the whole track
+    lats = np.fromiter((p[0] for p in points), dtype=np.float64, count=len(points))
+    lons = np.fromiter((p[1] for p in points), dtype=np.float64, count=len(points))
+    east, north = LV95_TRANSFORMER.transform(lons, lats)
 
-    return profile
+    # Azimuth and distance of every segment based on WGS-84 lat/lon
+    azims, _, dists = GEOD.inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
 
+    # Resolve missing elevations (NaN) from the cache or one bulk request – unresolved ones become 0.0
+    elevations = np.fromiter(
+        (np.nan if p[2] is None else p[2] for p in points), dtype=np.float64, count=len(points)
+    )
+    missing = np.flatnonzero(np.isnan(elevations))
+    if missing.size and use_height_api:
+        elevations[missing] = fetch_elevations_cached(
+            list(zip(east[missing].tolist(), north[missing].tolist()))
+        )
+    elevations = np.nan_to_num(elevations, nan=0.0)
+
+    return Profile(
+        e=east,
+        n=north,
+        ele=elevations,
+        dist=np.concatenate(([0.0], dists)),
+        azimuth=np.concatenate(([0.0], azims)),
+        delta_ele=np.diff(elevations, prepend=elevations[:1]),  # Elevation change based on resolved elevation
+    )
 
-def format_profile(profile: List[dict]) -> str:
+
+def format_profile(profile: Profile) -> str:
     """
     Render the profile as a human-readable table plus summary stats.
 
     Params:
-        profile: List of dicts with keys: 'e', 'n', 'ele', 'dist', 'azimuth', 'delta_ele'.
+        profile: The Profile to render.
     Returns:
         A formatted string representing the route profile.
     """
@@ -174,23 +410,30 @@ def format_profile(profile: List[dict]) -> str:
     )
     lines = [header, "", col_hdr, "-" * 100]
 
-    for i, pt in enumerate(profile, start=1):
-        elev_str = f"{pt['ele']:.2f}" if pt["ele"] is not None else "N/A"
+    columns = zip(
+        profile.e.tolist(),
+        profile.n.tolist(),
+        profile.dist.tolist(),
+        profile.ele.tolist(),
+        profile.delta_ele.tolist(),
+        profile.azimuth.tolist(),
+    )
+    for i, (e, n, dist, ele, delta_ele, azim) in enumerate(columns, start=1):
         lines.append(
-            f"{i:<4} {pt['e']:>12.2f} {pt['n']:>12.2f} {pt['dist']:>12.2f} "
-            f"{elev_str:>12} {pt['delta_ele']:>12.2f} {pt['azimuth']:>12.2f}"
+            f"{i:<4} {e:>12.2f} {n:>12.2f} {dist:>12.2f} "
+            f"{ele:>12.2f} {delta_ele:>12.2f} {azim:>12.2f}"
         )
 
     lines.append("-" * 100)
 
-    total_dist = sum(p["dist"] for p in profile)
+    total_dist = profile.dist.sum()
     lines.append(f"\nTotal distance: {total_dist:.2f} m")
 
-    if all(p["ele"] is not None for p in profile):
-        ascent = sum(max(0.0, p["delta_ele"]) for p in profile[1:])
-        descent = sum(max(0.0, -p["delta_ele"]) for p in profile[1:])
-        lines.append(f"Total ascent : {ascent:.2f} m")
-        lines.append(f"Total descent: {descent:.2f} m")
+    # build_profile resolves every elevation (0.0 where unavailable), so the totals always apply
+    ascent = np.clip(profile.delta_ele, 0.0, None).sum()
+    descent = np.clip(-profile.delta_ele, 0.0, None).sum()
+    lines.append(f"Total ascent : {ascent:.2f} m")
+    lines.append(f"Total descent: {descent:.2f} m")
 
     return "\n".join(lines)
 